@@ -9,6 +9,10 @@ class Settings(BaseSettings):
     model_name: str = "nari-labs/Dia-1.6B-0626"
     compute_dtype: str = "float16"
     device: str | None = None  # auto-detect: CUDA > MPS > CPU
+    # CPU only; skipped when the decoder is int8-quantized (see below)
+    torch_compile: bool = True  # compile + warm up decode steps at load
+    # CPU + float32 only (i.e. CPUs without BF16); takes precedence over torch_compile
+    quantize_int8: bool = True  # dynamic int8 decoder linears
 
     host: str = "0.0.0.0"
     port: int = 8000
@@ -3,6 +3,7 @@ from __future__ import annotations
 import logging
 import os
 import sys
+import threading
 import time
 from pathlib import Path
 from typing import TYPE_CHECKING
@@ -11,6 +12,13 @@ from typing import TYPE_CHECKING
 os.environ.setdefault("HF_HOME", "/app/models/cache")
 os.environ.setdefault("TRANSFORMERS_CACHE", "/app/models/cache")
 os.environ.setdefault("HF_HUB_CACHE", "/app/models/cache/hub")
+# Download progress is reported by polling the cache instead of per-chunk tqdm callbacks
+os.environ.setdefault("HF_HUB_DISABLE_PROGRESS_BARS", "1")
+# High-throughput mode for the Xet downloader (saturates bandwidth on large weight files)
+os.environ.setdefault("HF_XET_HIGH_PERFORMANCE", "1")
+# Persist compiled inductor graphs next to the model cache so restarts skip recompilation
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", "/app/models/cache/inductor")
+os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
 
 import torch
 
@@ -23,60 +31,6 @@ _backend_dir = str(Path(__file__).resolve().parent.parent / "backend")
 if _backend_dir not in sys.path:
     sys.path.insert(0, _backend_dir)
 
-# Enable real-time download progress monitoring
-import tqdm.std
-from functools import partial
-
-# Global progress tracking
-_global_progress = {"current": 0.0, "stage": "idle", "files_total": 0, "files_completed": 0}
-
-# Create a custom tqdm class that updates our global progress
-class ModelDownloadProgress(tqdm.std.tqdm):
-    def __init__(self, *args, **kwargs):
-        kwargs.setdefault('file', sys.stdout)
-        kwargs.setdefault('leave', True)
-        kwargs.setdefault('dynamic_ncols', True)
-        super().__init__(*args, **kwargs)
-        
-        # Track file downloads
-        if hasattr(self, 'desc') and self.desc:
-            _global_progress["files_total"] += 1
-    
-    def __enter__(self):
-        result = super().__enter__()
-        if hasattr(self, 'desc') and self.desc:
-            self.set_description(f"[model] {self.desc}")
-            _global_progress["stage"] = f"Downloading {self.desc}"
-        return result
-    
-    def update(self, n=1):
-        result = super().update(n)
-        if self.total and self.total > 0:
-            # Calculate progress for this file
-            file_progress = (self.n / self.total) * 100
-            # Update global progress (simplified - could be more sophisticated)
-            _global_progress["current"] = min(90, file_progress)
-            if hasattr(ModelManager, '_instance') and ModelManager._instance:
-                ModelManager._instance._download_progress = _global_progress["current"]
-                ModelManager._instance._download_stage = _global_progress["stage"]
-        return result
-    
-    def close(self):
-        result = super().close()
-        if hasattr(self, 'desc') and self.desc:
-            _global_progress["files_completed"] += 1
-            # Calculate overall progress
-            if _global_progress["files_total"] > 0:
-                overall_progress = (_global_progress["files_completed"] / _global_progress["files_total"]) * 90
-                _global_progress["current"] = overall_progress
-                if hasattr(ModelManager, '_instance') and ModelManager._instance:
-                    ModelManager._instance._download_progress = overall_progress
-        return result
-
-# Replace the default tqdm with our custom one
-tqdm.std.tqdm = ModelDownloadProgress
-tqdm.tqdm = ModelDownloadProgress
-
 # Enable huggingface_hub info logging
 logging.getLogger("huggingface_hub").setLevel(logging.INFO)
 _hf_handler = logging.StreamHandler(sys.stdout)
@@ -84,12 +38,28 @@ _hf_handler.setFormatter(logging.Formatter("[model] %(levelname)s: %(message)s")
 logging.getLogger("huggingface_hub").addHandler(_hf_handler)
 
 
+def _cpu_supports_bf16() -> bool:
+    """True if the host CPU advertises AVX-512 BF16 or AMX BF16 instructions."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    return bool(flags & {"avx512_bf16", "amx_bf16"})
+    except OSError:
+        pass
+    return False
+
+
 class ModelManager:
     """Singleton that lazily loads the Dia model once."""
 
     _instance: ModelManager | None = None
     _model = None
     _device: torch.device | None = None
+    _compiled: bool = False
+    _kv_cache: list | None = None
+    _kv_cache_tokens: int = 0
     _status: str = "idle"
     _error: str | None = None
     _download_progress: float = 0.0
@@ -117,8 +87,9 @@ class ModelManager:
         else:
             device = torch.device("cpu")
 
-        # Resolve dtype — force float32 on CPU/MPS
-        dtype_map = {"cpu": "float32", "mps": "float32", "cuda": "float16"}
+        # Resolve dtype — bfloat16 on CPUs with native BF16 matmul, else float32 on CPU/MPS
+        cpu_dtype = "bfloat16" if _cpu_supports_bf16() else "float32"
+        dtype_map = {"cpu": cpu_dtype, "mps": "float32", "cuda": "float16"}
         dtype = dtype_map.get(device.type, settings.compute_dtype)
 
         try:
@@ -154,10 +125,44 @@ class ModelManager:
             
             print(f"[model] Target device: {device}, dtype: {dtype}", flush=True)
             t0 = time.time()
-            self._model = Dia.from_pretrained(
-                settings.model_name, compute_dtype=dtype, device=device
-            )
+            download_done = threading.Event()
+            if not model_cached:
+                threading.Thread(
+                    target=self._watch_download,
+                    args=(settings.model_name, hub_cache_dir, download_done),
+                    daemon=True,
+                ).start()
+            try:
+                model = Dia.from_pretrained(
+                    settings.model_name, compute_dtype=dtype, device=device
+                )
+            finally:
+                download_done.set()
+
+            kv_cache = model.allocate_kv_cache(settings.max_tokens)
+
+            quantized = False
+            if settings.quantize_int8 and device.type == "cpu" and dtype == "float32":
+                self._quantize_decoder(model)
+                quantized = True
+
+            # Warm up before publishing the model so requests never race the compile.
+            # Dynamically quantized linears don't trace under torch.compile, so skip it then.
+            if settings.torch_compile and device.type == "cpu":
+                if quantized:
+                    print(
+                        "[model] Skipping torch.compile: int8-quantized decoder runs eagerly "
+                        "(set DIA_QUANTIZE_INT8=0 to compile instead)",
+                        flush=True,
+                    )
+                else:
+                    self._warmup_compiled(model, settings, kv_cache)
+
+            self._model = model
+            self._kv_cache = kv_cache
+            self._kv_cache_tokens = settings.max_tokens
             self._device = device
+
             self._download_progress = 100.0
             self._download_stage = "Loading complete"
 
@@ -172,6 +177,96 @@ class ModelManager:
             print(f"[model] FAILED to load model: {exc}", flush=True)
             raise
 
+    def _watch_download(self, model_name: str, hub_cache_dir: str, done: threading.Event) -> None:
+        """Track download progress by polling the size of the repo's blob cache."""
+        from huggingface_hub import HfApi
+
+        try:
+            info = HfApi().model_info(model_name, files_metadata=True)
+            total = sum(
+                f.size or 0 for f in info.siblings if f.rfilename in ("config.json", "model.safetensors")
+            )
+        except Exception:
+            return
+        if not total:
+            return
+
+        blobs_dir = Path(hub_cache_dir) / f"models--{model_name.replace('/', '--')}" / "blobs"
+        while not done.wait(1.0):
+            try:
+                downloaded = sum(p.stat().st_size for p in blobs_dir.iterdir())
+            except OSError:
+                continue
+            self._download_progress = min(90.0, downloaded / total * 90)
+
+    def _quantize_decoder(self, model) -> None:
+        """Swap the decoder's projections for dynamically quantized int8 linears."""
+        import torch.ao.quantization as tq
+        from dia.layers import linearize_dense_layers
+
+        engines = torch.backends.quantized.supported_engines
+        torch.backends.quantized.engine = "fbgemm" if "fbgemm" in engines else "qnnpack"
+
+        self._download_stage = "Quantizing model"
+        t0 = time.time()
+        linearize_dense_layers(model.model.decoder)
+        tq.quantize_dynamic(model.model.decoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        print(
+            f"[model] ✓ Quantized decoder to int8 ({torch.backends.quantized.engine}) in {time.time() - t0:.1f}s",
+            flush=True,
+        )
+
+    def _warmup_compiled(self, model, settings: Settings, kv_cache) -> None:
+        """Compile the decode path and trace it at the default generation shape.
+
+        Runs once without and once with a (dummy) audio prompt: API tasks always carry
+        an uploaded voice sample, and the prompted prefill traces a different graph.
+        """
+        import torch._inductor.config
+
+        torch._inductor.config.fx_graph_cache = True
+
+        self._status = "compiling"
+        self._download_stage = "Compiling model"
+        print("[model] Compiling decoder (first run may take a minute)…", flush=True)
+        num_channels = model.config.decoder_config.num_channels
+        dummy_prompt = torch.zeros((8, num_channels), dtype=torch.long)
+        t0 = time.time()
+        try:
+            with torch.inference_mode():
+                for audio_prompt in (None, dummy_prompt):
+                    model.generate(
+                        "[S1] Warm up.",
+                        max_tokens=settings.max_tokens,
+                        cfg_scale=settings.cfg_scale,
+                        temperature=settings.temperature,
+                        top_p=settings.top_p,
+                        cfg_filter_top_k=settings.cfg_filter_top_k,
+                        use_torch_compile=True,
+                        audio_prompt=audio_prompt,
+                        kv_cache=kv_cache,
+                    )
+        except Exception as exc:
+            # e.g. no C++ toolchain for inductor — serve eagerly rather than fail the load
+            print(f"[model] Compile failed, falling back to eager mode: {exc}", flush=True)
+            self._discard_compiled(model, kv_cache)
+            return
+        self._compiled = True
+        print(f"[model] ✓ Compiled and warmed up in {time.time() - t0:.1f}s", flush=True)
+
+    @staticmethod
+    def _discard_compiled(model, kv_cache) -> None:
+        """Undo Dia.generate's compile setup so later calls use the eager methods."""
+        import torch._dynamo
+
+        for attr in ("_prepare_generation", "_decoder_step", "_compiled"):
+            model.__dict__.pop(attr, None)
+        torch._dynamo.reset()
+        # A failed warm-up may have left the shared cache partially written
+        for cache in kv_cache:
+            cache.k.zero_()
+            cache.v.zero_()
+
     # ------------------------------------------------------------------
     @property
     def model(self):
@@ -185,6 +280,17 @@ class ModelManager:
             raise RuntimeError("Model not loaded — call load_model() first")
         return self._device
 
+    def kv_cache_for(self, max_tokens: int) -> list | None:
+        """Shared decoder KV cache if it fits `max_tokens`, else None (allocate per call).
+
+        Only safe while generation is serialized to one request at a time.
+        """
+        return self._kv_cache if max_tokens == self._kv_cache_tokens else None
+
+    @property
+    def compiled(self) -> bool:
+        return self._compiled
+
     @property
     def is_loaded(self) -> bool:
         return self._model is not None
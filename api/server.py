@@ -1,18 +1,22 @@
 from __future__ import annotations
 
 import asyncio
+import bisect
 import contextlib
-import io
-import json
 import logging
-import re
 import threading
 import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import blake3
 import numpy as np
+import orjson
 import soundfile as sf
 import torch
+from scipy.fft import rfft, rfftfreq
 from fastapi import FastAPI, UploadFile, File, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
@@ -31,52 +35,72 @@ class _HealthFilter(logging.Filter):
 
 logging.getLogger("uvicorn.access").addFilter(_HealthFilter())
 
-# ---------- generation lock (one at a time) ----------
-_generate_lock = threading.Lock()
+# ---------- generation queue (one at a time, on a dedicated thread) ----------
+_gen_sem = asyncio.Semaphore(1)
+_gen_exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dia-gen")
+_gen_tasks: set[asyncio.Task] = set()
 
 # ---------- helpers ----------
 ALLOWED_AUDIO_EXTS = {".wav", ".mp3", ".flac", ".ogg"}
+UPLOAD_CHUNK_SIZE = 1 << 20
+FFT_SECONDS = 3  # audio window used to estimate the frequency range
+META_CACHE_SIZE = 64
+PROGRESS_INTERVAL_S = 0.5
+PROGRESS_MIN_DELTA = 1.0  # percent
+
+# Upload metadata keyed by content hash, so re-uploads of the same bytes skip decoding
+_meta_cache: OrderedDict[str, tuple[float, int, int, int, int]] = OrderedDict()
+
+
+def _dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
+
+
+_STAGE_BOUNDS = (20, 50, 85)
+_STAGE_LABELS = ("Initializing", "Encoding", "Generating Audio", "Finalizing")
 
 
 def _stage_label(progress: float) -> str:
-    if progress < 20:
-        return "Initializing"
-    if progress < 50:
-        return "Encoding"
-    if progress < 85:
-        return "Generating Audio"
-    return "Finalizing"
-
-
-class ProgressCapture(io.StringIO):
-    """Wraps stdout during generation to parse progress lines."""
-
-    _step_re = re.compile(r"generate step (\d+):")
-
-    def __init__(self, task_id: str, max_tokens: int) -> None:
-        super().__init__()
-        self.task_id = task_id
-        self.max_tokens = max_tokens
-
-    def write(self, s: str) -> int:
-        # Parse `generate step N:` lines emitted every ~86 tokens
-        m = self._step_re.search(s)
-        if m:
-            step = int(m.group(1))
-            pct = min(step / self.max_tokens * 100, 99.0)
-            task_store.update(
-                self.task_id,
-                progress=pct,
-                current_stage=_stage_label(pct),
-            )
-        return super().write(s)
+    return _STAGE_LABELS[bisect.bisect_right(_STAGE_BOUNDS, progress)]
+
 
+def _audio_metadata(path: Path) -> tuple[float, int, int, int, int]:
+    """Return (duration, sample_rate, channels, freq_low, freq_high) for an uploaded file."""
+    duration, sample_rate, channels = 0.0, 0, 1
+    freq_low, freq_high = 80, 4000
+    try:
+        with sf.SoundFile(str(path)) as f:
+            sample_rate = f.samplerate
+            channels = f.channels
+            duration = f.frames / sample_rate if sample_rate else 0.0
+
+            # Estimate frequency range via FFT over a short window from the middle
+            window = sample_rate * FFT_SECONDS
+            f.seek(max(0, f.frames // 2 - window // 2))
+            data = f.read(window, dtype="float32", always_2d=False)
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+        n = len(data)
+        if n > 0 and sample_rate > 0:
+            fft_mag = np.abs(rfft(data, workers=-1))
+            above = fft_mag > fft_mag.max() * 0.01
+            lo = int(np.argmax(above))
+            hi = len(above) - 1 - int(np.argmax(above[::-1]))
+            if above[lo]:
+                freqs = rfftfreq(n, 1.0 / sample_rate)
+                freq_low = int(freqs[lo])
+                freq_high = int(freqs[hi])
+    except Exception:
+        pass
 
-def _run_generation(task_id: str) -> None:
-    """Run model.generate() synchronously — called in a background thread."""
+    return duration, sample_rate, channels, freq_low, freq_high
+
+
+def _run_generation(task_id: str) -> np.ndarray | None:
+    """Run model.generate() synchronously — called on the generation executor."""
     task = task_store.get(task_id)
     if task is None:
-        return
+        return None
 
     task_store.update(
         task_id,
@@ -85,10 +109,22 @@ def _run_generation(task_id: str) -> None:
         current_stage="Initializing",
     )
 
-    capture = ProgressCapture(task_id, task.max_tokens)
+    # Coalesce per-step progress: publish at most every PROGRESS_INTERVAL_S unless
+    # progress has moved by at least PROGRESS_MIN_DELTA percent.
+    last_time = time.monotonic()
+    last_pct = 0.0
+
+    def on_step(step: int, total: int) -> None:
+        nonlocal last_time, last_pct
+        pct = min(step / total * 100, 99.0)
+        now = time.monotonic()
+        if now - last_time < PROGRESS_INTERVAL_S and pct - last_pct < PROGRESS_MIN_DELTA:
+            return
+        last_time, last_pct = now, pct
+        task_store.update(task_id, progress=pct, current_stage=_stage_label(pct))
 
     try:
-        with _generate_lock, contextlib.redirect_stdout(capture), torch.inference_mode():
+        with torch.inference_mode():
             output_audio_np = model_manager.model.generate(
                 task.text,
                 max_tokens=task.max_tokens,
@@ -96,27 +132,39 @@ def _run_generation(task_id: str) -> None:
                 temperature=task.temperature,
                 top_p=task.top_p,
                 cfg_filter_top_k=task.cfg_filter_top_k,
-                use_torch_compile=False,
+                use_torch_compile=model_manager.compiled,
                 audio_prompt=task.audio_path,
-                verbose=True,
+                progress_callback=on_step,
+                kv_cache=model_manager.kv_cache_for(task.max_tokens),
             )
+    except Exception as exc:
+        task_store.update(
+            task_id,
+            status=TaskStatus.FAILED,
+            error=str(exc),
+        )
+        return None
+
+    if output_audio_np is None:
+        task_store.update(
+            task_id,
+            status=TaskStatus.FAILED,
+            error="Generation produced no output.",
+        )
+    return output_audio_np
 
-        if output_audio_np is None:
-            task_store.update(
-                task_id,
-                status=TaskStatus.FAILED,
-                error="Generation produced no output.",
-            )
-            return
 
-        # Save WAV
+def _save_output(task_id: str, audio: np.ndarray) -> None:
+    """Write generated audio as 16-bit PCM WAV and mark the task complete."""
+    try:
         sample_rate = 44100
         output_dir = Path(settings.output_dir)
         output_dir.mkdir(parents=True, exist_ok=True)
         out_path = output_dir / f"{task_id}.wav"
-        sf.write(str(out_path), output_audio_np, sample_rate)
+        # libsndfile rounds to 16-bit itself; clip so out-of-range peaks don't wrap
+        sf.write(str(out_path), np.clip(audio, -1.0, 1.0), sample_rate, subtype="PCM_16")
 
-        duration = len(output_audio_np) / sample_rate
+        duration = len(audio) / sample_rate
         size_bytes = out_path.stat().st_size
 
         task_store.update(
@@ -137,6 +185,15 @@ def _run_generation(task_id: str) -> None:
         )
 
 
+async def _schedule_generation(task_id: str) -> None:
+    loop = asyncio.get_running_loop()
+    async with _gen_sem:
+        audio = await loop.run_in_executor(_gen_exec, _run_generation, task_id)
+    # Save outside the generation slot so the next request can start immediately
+    if audio is not None:
+        await asyncio.to_thread(_save_output, task_id, audio)
+
+
 # ---------- lifespan ----------
 _model_loading = False
 
@@ -170,6 +227,11 @@ async def lifespan(app: FastAPI):
     cleanup_task.cancel()
     with contextlib.suppress(asyncio.CancelledError):
         await cleanup_task
+    # Cancel queued generations first so none reach run_in_executor after shutdown
+    for gen_task in tuple(_gen_tasks):
+        gen_task.cancel()
+    await asyncio.gather(*_gen_tasks, return_exceptions=True)
+    _gen_exec.shutdown(wait=False, cancel_futures=True)
 
 
 # ---------- app ----------
@@ -206,48 +268,42 @@ async def upload_audio(file: UploadFile = File(...)):
     if ext not in ALLOWED_AUDIO_EXTS:
         raise HTTPException(400, f"Unsupported file type: {ext}")
 
-    # Read content + size check
-    content = await file.read()
+    # Stream to a temporary file, enforcing the size cap as we go; the task is only
+    # created once the upload is accepted, and partial files never outlive a failure
     max_bytes = settings.max_upload_size_mb * 1024 * 1024
-    if len(content) > max_bytes:
-        raise HTTPException(400, f"File exceeds {settings.max_upload_size_mb} MB limit")
-
-    # Create task & save file
-    task = task_store.create()
     upload_dir = Path(settings.upload_dir)
     upload_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = upload_dir / f"{uuid.uuid4().hex}.part"
+    total = 0
+    hasher = blake3.blake3()
+    try:
+        with tmp_path.open("wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total += len(chunk)
+                if total > max_bytes:
+                    raise HTTPException(400, f"File exceeds {settings.max_upload_size_mb} MB limit")
+                hasher.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    task = task_store.create()
     save_path = upload_dir / f"{task.task_id}{ext}"
-    save_path.write_bytes(content)
+    tmp_path.replace(save_path)
     task_store.update(task.task_id, audio_path=str(save_path))
 
-    # Extract real metadata via soundfile
-    try:
-        info = sf.info(str(save_path))
-        duration = info.duration
-        sample_rate = info.samplerate
-        channels = info.channels
-    except Exception:
-        duration = 0.0
-        sample_rate = 0
-        channels = 1
-
-    # Estimate frequency range via FFT
-    freq_low, freq_high = 80, 4000
-    try:
-        data, sr = sf.read(str(save_path), dtype="float32")
-        if data.ndim > 1:
-            data = data.mean(axis=1)
-        n = len(data)
-        if n > 0 and sr > 0:
-            fft_mag = np.abs(np.fft.rfft(data))
-            freqs = np.fft.rfftfreq(n, 1.0 / sr)
-            threshold = fft_mag.max() * 0.01
-            above = np.where(fft_mag > threshold)[0]
-            if len(above) > 0:
-                freq_low = int(freqs[above[0]])
-                freq_high = int(freqs[above[-1]])
-    except Exception:
-        pass
+    # Extract metadata off the event loop (or reuse it for identical content)
+    digest = hasher.hexdigest()
+    meta = _meta_cache.get(digest)
+    if meta is None:
+        meta = await asyncio.to_thread(_audio_metadata, save_path)
+        _meta_cache[digest] = meta
+        if len(_meta_cache) > META_CACHE_SIZE:
+            _meta_cache.popitem(last=False)
+    else:
+        _meta_cache.move_to_end(digest)
+    duration, sample_rate, channels, freq_low, freq_high = meta
 
     # Quality score heuristic (based on sample rate & duration)
     quality = min(95.0, 60.0 + min(sample_rate / 1000, 20.0) + min(duration * 3, 15.0))
@@ -285,7 +341,8 @@ async def generate(
     if task is None:
         raise HTTPException(404, "Task not found")
 
-    # Store generation params
+    # Store generation params and reset any previous run's outcome before queueing,
+    # so the stream below never replays a stale error/complete while we wait our turn
     task_store.update(
         task_id,
         text=text,
@@ -294,69 +351,87 @@ async def generate(
         temperature=temperature,
         top_p=top_p,
         cfg_filter_top_k=cfg_filter_top_k,
+        status=TaskStatus.PENDING,
+        progress=0.0,
+        current_stage="Queued",
+        error=None,
+        output_path=None,
+        output_duration=None,
+        output_size_bytes=None,
     )
 
-    # Kick off generation in a background thread
-    thread = threading.Thread(target=_run_generation, args=(task_id,), daemon=True)
-    thread.start()
+    # Queue generation; the SSE stream below reports its progress
+    gen_task = asyncio.create_task(_schedule_generation(task_id))
+    _gen_tasks.add(gen_task)
+    gen_task.add_done_callback(_gen_tasks.discard)
 
-    # SSE stream — poll task store for updates
+    # SSE stream — wake on task store updates (with a periodic re-check)
     async def event_stream():
         last_progress = -1.0
-        while True:
-            await asyncio.sleep(0.5)
-            t = task_store.get(task_id)
-            if t is None:
-                yield {"event": "error", "data": json.dumps({"error": "Task lost"})}
-                return
-
-            if t.status == TaskStatus.FAILED:
-                yield {
-                    "event": "error",
-                    "data": json.dumps({"error": t.error or "Unknown error"}),
-                }
-                return
-
-            if t.status == TaskStatus.COMPLETE:
-                # Send a final progress tick
-                yield {
-                    "event": "progress",
-                    "data": json.dumps(
-                        {"status": "processing", "progress": 100, "stage": "Complete"}
-                    ),
-                }
-                mins, secs = divmod(t.output_duration or 0, 60)
-                dur_fmt = (
-                    f"{int(mins):02d}:{secs:05.2f}s"
-                    if mins
-                    else f"00:{secs:05.2f}s"
-                )
-                yield {
-                    "event": "complete",
-                    "data": json.dumps(
-                        {
-                            "task_id": task_id,
-                            "duration_formatted": dur_fmt,
-                            "sample_rate": 44100,
-                            "file_size_bytes": t.output_size_bytes,
-                        }
-                    ),
-                }
-                return
-
-            # In-progress update
-            if t.progress != last_progress:
-                last_progress = t.progress
-                yield {
-                    "event": "progress",
-                    "data": json.dumps(
-                        {
-                            "status": "processing",
-                            "progress": round(t.progress, 1),
-                            "stage": t.current_stage,
-                        }
-                    ),
-                }
+        wakeup = task_store.subscribe(task_id)
+        if wakeup is None:
+            yield {"event": "error", "data": _dumps({"error": "Task lost"})}
+            return
+        try:
+            while True:
+                t = task_store.get(task_id)
+                if t is None:
+                    yield {"event": "error", "data": _dumps({"error": "Task lost"})}
+                    return
+
+                if t.status == TaskStatus.FAILED:
+                    yield {
+                        "event": "error",
+                        "data": _dumps({"error": t.error or "Unknown error"}),
+                    }
+                    return
+
+                if t.status == TaskStatus.COMPLETE:
+                    # Send a final progress tick
+                    yield {
+                        "event": "progress",
+                        "data": _dumps(
+                            {"status": "processing", "progress": 100, "stage": "Complete"}
+                        ),
+                    }
+                    mins, secs = divmod(t.output_duration or 0, 60)
+                    dur_fmt = (
+                        f"{int(mins):02d}:{secs:05.2f}s"
+                        if mins
+                        else f"00:{secs:05.2f}s"
+                    )
+                    yield {
+                        "event": "complete",
+                        "data": _dumps(
+                            {
+                                "task_id": task_id,
+                                "duration_formatted": dur_fmt,
+                                "sample_rate": 44100,
+                                "file_size_bytes": t.output_size_bytes,
+                            }
+                        ),
+                    }
+                    return
+
+                # In-progress update
+                if t.progress != last_progress:
+                    last_progress = t.progress
+                    yield {
+                        "event": "progress",
+                        "data": _dumps(
+                            {
+                                "status": "processing",
+                                "progress": round(t.progress, 1),
+                                "stage": t.current_stage,
+                            }
+                        ),
+                    }
+
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(wakeup.wait(), timeout=30)
+                wakeup.clear()
+        finally:
+            task_store.unsubscribe(task_id, wakeup)
 
     return EventSourceResponse(event_stream())
 
@@ -367,10 +442,17 @@ async def download(task_id: str):
     if task is None or task.output_path is None:
         raise HTTPException(404, "File not found")
     path = Path(task.output_path)
-    if not path.exists():
+    try:
+        st = path.stat()  # handed to FileResponse so it doesn't stat again
+    except FileNotFoundError:
         raise HTTPException(404, "File not found")
     return FileResponse(
         str(path),
         media_type="audio/wav",
         filename=f"voxsynth-{task_id}.wav",
+        stat_result=st,
+        headers={
+            "ETag": f'W/"{task_id}-{st.st_size}-{int(st.st_mtime)}"',
+            "Cache-Control": "private, max-age=0, must-revalidate",
+        },
     )
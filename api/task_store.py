@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import heapq
 import time
 import threading
 import uuid
@@ -33,50 +35,87 @@ class GenerationTask:
     output_size_bytes: int | None = None
     error: str | None = None
     created_at: float = field(default_factory=time.time)
+    # One wakeup per SSE stream, set on every update so streams wake on real
+    # changes instead of polling without clearing each other's signal
+    subscribers: set[asyncio.Event] = field(default_factory=set, repr=False)
+    loop: asyncio.AbstractEventLoop | None = field(default=None, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
 
 
 class TaskStore:
-    """Thread-safe in-memory task store."""
+    """Thread-safe in-memory task store.
+
+    Lookups are lock-free (dict reads are atomic under the GIL); updates take
+    the task's own lock, and only insert/remove take the index lock.
+    """
 
     def __init__(self) -> None:
         self._tasks: dict[str, GenerationTask] = {}
-        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        # (created_at, task_id), oldest first — lets cleanup stop at the first live task
+        self._expiry_heap: list[tuple[float, str]] = []
 
     def create(self, **kwargs) -> GenerationTask:
         task_id = uuid.uuid4().hex[:12]
         task = GenerationTask(task_id=task_id, **kwargs)
-        with self._lock:
+        try:
+            task.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass  # created outside the event loop — no one to notify
+        with self._index_lock:
             self._tasks[task_id] = task
+            heapq.heappush(self._expiry_heap, (task.created_at, task_id))
         return task
 
     def get(self, task_id: str) -> GenerationTask | None:
-        with self._lock:
-            return self._tasks.get(task_id)
+        return self._tasks.get(task_id)
 
     def update(self, task_id: str, **kwargs) -> None:
-        with self._lock:
-            task = self._tasks.get(task_id)
-            if task is None:
-                return
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        with task.lock:
             for k, v in kwargs.items():
                 setattr(task, k, v)
+            subscribers = tuple(task.subscribers)
+        if subscribers and task.loop is not None and not task.loop.is_closed():
+            for event in subscribers:
+                task.loop.call_soon_threadsafe(event.set)
+
+    def subscribe(self, task_id: str) -> asyncio.Event | None:
+        """Register a wakeup event that is set on every update to the task."""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        event = asyncio.Event()
+        with task.lock:
+            task.subscribers.add(event)
+        return event
+
+    def unsubscribe(self, task_id: str, event: asyncio.Event) -> None:
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        with task.lock:
+            task.subscribers.discard(event)
 
     def cleanup_old(self, max_age_seconds: int = 3600) -> None:
         """Remove expired tasks and their files."""
-        now = time.time()
-        to_delete: list[str] = []
-        with self._lock:
-            for tid, task in self._tasks.items():
-                if now - task.created_at > max_age_seconds:
-                    to_delete.append(tid)
-            for tid in to_delete:
-                task = self._tasks.pop(tid)
-                for p in (task.audio_path, task.output_path):
-                    if p:
-                        try:
-                            Path(p).unlink(missing_ok=True)
-                        except OSError:
-                            pass
+        cutoff = time.time() - max_age_seconds
+        expired: list[GenerationTask] = []
+        with self._index_lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < cutoff:
+                _, tid = heapq.heappop(self._expiry_heap)
+                task = self._tasks.pop(tid, None)
+                if task is not None:
+                    expired.append(task)
+        for task in expired:
+            for p in (task.audio_path, task.output_path):
+                if p:
+                    try:
+                        Path(p).unlink(missing_ok=True)
+                    except OSError:
+                        pass
 
 
 task_store = TaskStore()
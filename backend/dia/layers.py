@@ -58,6 +58,59 @@ class DenseGeneral(nn.Module):
         return output
 
 
+def dense_to_linear_weight(dense: DenseGeneral) -> Tensor:
+    """Returns a DenseGeneral kernel as an `nn.Linear` weight of shape (prod(out_features), prod(in_shapes))."""
+    W_dg = dense.weight.data
+
+    out_features = 1
+    input_features = 1
+    for dim in dense.out_features:
+        out_features *= dim
+    for dim in dense.in_shapes:
+        input_features *= dim
+
+    W_dg_reshaped_for_linear_T = W_dg.reshape(input_features, out_features)
+    return W_dg_reshaped_for_linear_T.transpose(0, 1).contiguous()
+
+
+class LinearGeneral(nn.Module):
+    """
+    `nn.Linear`-backed drop-in for a DenseGeneral that contracts its trailing axes.
+    Flattens the contracted dims, applies a plain linear layer and restores the
+    output feature shape, so standard tooling (e.g. dynamic int8 quantization)
+    can treat the projection as an `nn.Linear`.
+    """
+
+    def __init__(self, dense: DenseGeneral):
+        super().__init__()
+        self.in_shapes = dense.in_shapes
+        self.out_features = dense.out_features
+        self.dtype = dense.weight.dtype
+
+        weight = dense_to_linear_weight(dense)
+        out_features, in_features = weight.shape
+
+        # Built on meta so no throwaway weight is allocated or initialized
+        self.linear = nn.Linear(in_features, out_features, bias=False, device="meta", dtype=self.dtype)
+        self.linear.weight = nn.Parameter(weight, requires_grad=False)
+
+    def forward(self, inputs: Tensor) -> Tensor:
+        lead_shape = inputs.shape[: inputs.ndim - len(self.in_shapes)]
+        output = self.linear(inputs.reshape(*lead_shape, -1).to(self.dtype))
+        return output.reshape(*lead_shape, *self.out_features).to(inputs.dtype)
+
+
+def linearize_dense_layers(module: nn.Module) -> None:
+    """Replaces every trailing-axis DenseGeneral under `module` with an equivalent LinearGeneral, in place."""
+    for name, child in module.named_children():
+        if isinstance(child, DenseGeneral):
+            n = len(child.in_shapes)
+            if tuple(child.axis) == tuple(range(-n, 0)):
+                setattr(module, name, LinearGeneral(child))
+        else:
+            linearize_dense_layers(child)
+
+
 class MlpBlock(nn.Module):
     """MLP block using DenseGeneral."""
 
@@ -110,10 +163,16 @@ class RotaryEmbedding(nn.Module):
         self.max_timescale = max_timescale
         self.compute_dtype = dtype
 
-        half_embedding_dim = embedding_dims // 2
-        fraction = (2.0 * torch.arange(0, half_embedding_dim)) / embedding_dims
-        timescale = (self.min_timescale * (self.max_timescale / self.min_timescale) ** fraction).to(torch.float32)
-        self.register_buffer("timescale", timescale, persistent=False)
+        self.register_buffer("timescale", self._compute_timescale(), persistent=False)
+
+    def _compute_timescale(self, device: torch.device | None = None) -> torch.Tensor:
+        half_embedding_dim = self.embedding_dims // 2
+        fraction = (2.0 * torch.arange(0, half_embedding_dim, device=device)) / self.embedding_dims
+        return (self.min_timescale * (self.max_timescale / self.min_timescale) ** fraction).to(torch.float32)
+
+    def reset_timescale(self, device: torch.device) -> None:
+        """Rebuilds the (non-persistent) timescale buffer on `device`, e.g. after meta-device init."""
+        self.timescale = self._compute_timescale(device)
 
     def forward(self, inputs: torch.Tensor, position: torch.Tensor):
         """Applies RoPE."""
@@ -404,18 +463,7 @@ class SelfAttention(nn.Module):
         self.is_fused_qkv = False
 
     def get_linear_weight(self, dense: DenseGeneral):
-        W_dg = dense.weight.data
-
-        out_features = 1
-        input_features = 1
-        for dim in dense.out_features:
-            out_features *= dim
-        for dim in dense.in_shapes:
-            input_features *= dim
-
-        W_dg_reshaped_for_linear_T = W_dg.reshape(input_features, out_features)
-        linear_weight = W_dg_reshaped_for_linear_T.transpose(0, 1).contiguous()
-        return linear_weight
+        return dense_to_linear_weight(dense)
 
     def patch_fused_qkv(self):
         q_proj_weight = self.get_linear_weight(self.q_proj)
@@ -1,6 +1,6 @@
 import time
 from enum import Enum
-from typing import Callable
+from typing import Callable, Iterable
 
 import numpy as np
 import torch
@@ -9,8 +9,8 @@ import torchaudio
 
 from .audio import apply_audio_delay, build_delay_indices, build_revert_indices, revert_audio_delay
 from .config import DiaConfig
-from .layers import DiaModel
-from .state import DecoderInferenceState, DecoderOutput, EncoderInferenceState
+from .layers import DiaModel, RotaryEmbedding
+from .state import DecoderInferenceState, DecoderOutput, EncoderInferenceState, KVCache
 
 
 DEFAULT_SAMPLE_RATE = 44100
@@ -157,17 +157,18 @@ class Dia:
         if config is None:
             raise FileNotFoundError(f"Config file not found at {config_path}")
 
-        dia = cls(config, compute_dtype, device, load_dac)
+        # Skip random weight init; every tensor is replaced by the checkpoint below.
+        with torch.device("meta"):
+            dia = cls(config, compute_dtype, device, load_dac)
 
         try:
             state_dict = torch.load(checkpoint_path, map_location=dia.device)
-            dia.model.load_state_dict(state_dict)
+            dia._assign_weights(state_dict.items(), checkpoint_path)
         except FileNotFoundError:
             raise FileNotFoundError(f"Checkpoint file not found at {checkpoint_path}")
         except Exception as e:
             raise RuntimeError(f"Error loading checkpoint from {checkpoint_path}") from e
 
-        dia.model.to(dia.device)
         dia.model.eval()
         if load_dac:
             dia._load_dac_model()
@@ -199,25 +200,82 @@ class Dia:
             FileNotFoundError: If config or checkpoint download/loading fails.
             RuntimeError: If there is an error loading the checkpoint.
         """
-        if isinstance(compute_dtype, str):
-            compute_dtype = ComputeDtype(compute_dtype)
+        from huggingface_hub import hf_hub_download
 
-        # Load model directly using DiaModel's from_pretrained which handles HF download
         try:
-            loaded_model = DiaModel.from_pretrained(model_name, compute_dtype=compute_dtype.to_dtype())
+            config_path = hf_hub_download(repo_id=model_name, filename="config.json")
+            checkpoint_path = hf_hub_download(repo_id=model_name, filename="model.safetensors")
         except Exception as e:
-            raise RuntimeError(f"Error loading model from Hugging Face Hub ({model_name})") from e
+            raise FileNotFoundError(f"Could not download model files from Hugging Face Hub ({model_name})") from e
+
+        config = DiaConfig.load(config_path)
+        if config is None:
+            raise FileNotFoundError(f"Config file not found at {config_path}")
 
-        config = loaded_model.config  # Get config from the loaded model
-        dia = cls(config, compute_dtype, device, load_dac)
+        # Build the module tree without allocating (or randomly initializing) any storage;
+        # the checkpoint tensors are then streamed straight onto the target device.
+        with torch.device("meta"):
+            dia = cls(config, compute_dtype, device, load_dac)
+
+        try:
+            dia._load_safetensors(checkpoint_path)
+        except Exception as e:
+            raise RuntimeError(f"Error loading model from Hugging Face Hub ({model_name})") from e
 
-        dia.model = loaded_model  # Assign the already loaded model
-        dia.model.to(dia.device)
         dia.model.eval()
         if load_dac:
             dia._load_dac_model()
         return dia
 
+    def _load_safetensors(self, checkpoint_path: str) -> None:
+        """Loads a safetensors checkpoint into a model built on the meta device.
+
+        Each tensor is read directly onto `self.device`, so peak memory stays close
+        to the model size and no separate host-to-device copy is needed.
+
+        Args:
+            checkpoint_path: Path to the `.safetensors` checkpoint file.
+
+        Raises:
+            RuntimeError: If the checkpoint does not provide every model weight.
+        """
+        from safetensors import safe_open
+
+        with safe_open(checkpoint_path, framework="pt", device=str(self.device)) as f:
+            self._assign_weights(((name, f.get_tensor(name)) for name in f.keys()), checkpoint_path)
+
+    def _assign_weights(self, tensors: Iterable[tuple[str, torch.Tensor]], source: str) -> None:
+        """Replaces the meta-device weights of `self.model` with checkpoint tensors.
+
+        Tensors are cast to the dtype the owning module declared and assigned in
+        place of the placeholders, so no randomly initialized copy ever exists.
+
+        Args:
+            tensors: `(name, tensor)` pairs keyed like `self.model.state_dict()`.
+            source: Checkpoint location, used in error messages.
+
+        Raises:
+            RuntimeError: If the checkpoint does not provide every model weight.
+        """
+        for name, tensor in tensors:
+            module_name, _, attr = name.rpartition(".")
+            module = self.model.get_submodule(module_name)
+            current = getattr(module, attr)
+            tensor = tensor.to(device=self.device, dtype=current.dtype)
+            if isinstance(current, torch.nn.Parameter):
+                setattr(module, attr, torch.nn.Parameter(tensor, requires_grad=False))
+            else:
+                setattr(module, attr, tensor)
+
+        # Non-persistent buffers are not part of the checkpoint.
+        for module in self.model.modules():
+            if isinstance(module, RotaryEmbedding):
+                module.reset_timescale(self.device)
+
+        missing = [name for name, t in self.model.state_dict(keep_vars=True).items() if t.is_meta]
+        if missing:
+            raise RuntimeError(f"Checkpoint {source} is missing weights: {', '.join(missing[:5])}")
+
     def _load_dac_model(self):
         """Loads the Descript Audio Codec (DAC) model.
 
@@ -346,6 +404,7 @@ class Dia:
         audio_prompts: list[torch.Tensor | None],
         max_tokens: int | None = None,
         attn_fn: Callable = F.scaled_dot_product_attention,
+        kv_cache: list[KVCache] | None = None,
     ):
         """Initializes the model state for generation.
 
@@ -357,6 +416,7 @@ class Dia:
         Args:
             text: The padded text input tensor, shape [B, 1, T_text].
             audio_prompts: A list of prepared audio prompt tensors or None.
+            kv_cache: Optional preallocated decoder self-attention caches to reuse.
 
         Returns:
             A tuple containing:
@@ -382,6 +442,7 @@ class Dia:
             dec_cross_attn_cache,
             self.compute_dtype,
             max_generation_length=max_tokens,
+            self_attn_cache=kv_cache,
         )
         prefill, prefill_steps = self._prepare_audio_prompt(audio_prompts)
 
@@ -396,6 +457,31 @@ class Dia:
 
         return dec_state, dec_output
 
+    def allocate_kv_cache(self, max_tokens: int, batch_size: int = 1) -> list[KVCache]:
+        """Preallocates decoder self-attention caches that can be reused across `generate` calls.
+
+        Args:
+            max_tokens: The generation length the caches are sized for.
+            batch_size: The number of prompts generated per call.
+
+        Returns:
+            One zero-initialized KVCache per decoder layer, to be passed as `kv_cache`
+            to `generate` with the same `max_tokens` and batch size. Calls sharing a
+            cache must not run concurrently.
+        """
+        dec_config = self.config.decoder_config
+        return [
+            KVCache(
+                batch_size,
+                dec_config.num_key_value_heads,
+                max_tokens,
+                dec_config.head_dim,
+                self.compute_dtype,
+                self.device,
+            )
+            for _ in range(dec_config.num_hidden_layers)
+        ]
+
     def _decoder_step(
         self,
         tokens_Bx1xC: torch.Tensor,
@@ -604,6 +690,8 @@ class Dia:
         audio_prompt_path: list[str | torch.Tensor | None] | str | torch.Tensor | None = None,
         use_cfg_filter: bool | None = None,
         verbose: bool = False,
+        progress_callback: Callable[[int, int], None] | None = None,
+        kv_cache: list[KVCache] | None = None,
     ) -> np.ndarray | list[np.ndarray]:
         """Generates audio corresponding to the input text.
 
@@ -628,6 +716,11 @@ class Dia:
             use_cfg_filter: (Deprecated) This parameter is no longer used.
             verbose: If True, prints progress information during generation, including
                      speed metrics.
+            progress_callback: Optional callable invoked after every decoder step with
+                               `(step, max_tokens)`. Runs on the generation thread, so it
+                               should return quickly.
+            kv_cache: Optional caches from `allocate_kv_cache` to reuse instead of
+                      allocating new ones; must match `max_tokens` and the batch size.
 
         Returns:
             If a single text prompt was provided, returns a NumPy array containing the
@@ -676,7 +769,7 @@ class Dia:
             text = [self._encode_text(text)]
         text = self._pad_text_input(text)
 
-        dec_state, dec_output = self._prepare_generation(text, audio_prompt, max_tokens=max_tokens)
+        dec_state, dec_output = self._prepare_generation(text, audio_prompt, max_tokens=max_tokens, kv_cache=kv_cache)
         dec_step = min(dec_output.prefill_steps) - 1
         current_idx = torch.tensor([dec_step], device=self.device)
 
@@ -750,6 +843,9 @@ class Dia:
 
             dec_step += 1
 
+            if progress_callback is not None:
+                progress_callback(dec_step, max_tokens)
+
             if verbose and dec_step % 86 == 0:
                 duration = time.time() - start_time
                 if duration > 0:
@@ -761,6 +857,13 @@ class Dia:
         # --- Finalize and Extract Output ---
         final_step = dec_step + 1
 
+        if kv_cache is not None:
+            # Positions past the current step are masked, but clear the written prefix so the
+            # shared buffers start every call in the same state as freshly allocated ones.
+            for cache in kv_cache:
+                cache.k[:, :, :final_step].zero_()
+                cache.v[:, :, :final_step].zero_()
+
         finished_step_Bx[finished_step_Bx == -1] = final_step - max_delay_pattern
 
         prefill_steps_tensor = torch.tensor(dec_output.prefill_steps, device=self.device)
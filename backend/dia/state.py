@@ -139,8 +139,13 @@ class DecoderInferenceState:
         dec_cross_attn_cache: list[KVCache],
         compute_dtype: torch.dtype,
         max_generation_length: Optional[int] = None,
+        self_attn_cache: Optional[list[KVCache]] = None,
     ) -> "DecoderInferenceState":
-        """Creates DecoderInferenceParams from DiaConfig and a device."""
+        """Creates DecoderInferenceParams from DiaConfig and a device.
+
+        `self_attn_cache` lets callers reuse preallocated per-layer caches instead of
+        allocating fresh ones; they must match the batch size and generation length.
+        """
         device = enc_out.device
         max_audio_len = max_generation_length or config.decoder_config.max_position_embeddings
         batch_size = enc_out.shape[0] // 2
@@ -150,17 +155,23 @@ class DecoderInferenceState:
         dec_mask = torch.ones((2 * batch_size, 1), dtype=torch.bool, device=device)
         cross_attn_mask = create_attn_mask(dec_mask, enc_state.padding_mask, device, is_causal=False)
 
-        self_attn_cache = [
-            KVCache(
-                batch_size,
-                config.decoder_config.num_key_value_heads,
-                max_audio_len,
-                config.decoder_config.head_dim,
-                compute_dtype,
-                device,
+        if self_attn_cache is None:
+            self_attn_cache = [
+                KVCache(
+                    batch_size,
+                    config.decoder_config.num_key_value_heads,
+                    max_audio_len,
+                    config.decoder_config.head_dim,
+                    compute_dtype,
+                    device,
+                )
+                for _ in range(config.decoder_config.num_hidden_layers)
+            ]
+        elif self_attn_cache[0].k.shape[0] != 2 * batch_size or self_attn_cache[0].k.shape[2] != max_audio_len:
+            raise ValueError(
+                f"KV cache shape {tuple(self_attn_cache[0].k.shape)} does not match "
+                f"batch size {batch_size} and generation length {max_audio_len}"
             )
-            for _ in range(config.decoder_config.num_hidden_layers)
-        ]
 
         return cls(
             device=device,